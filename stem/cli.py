@@ -1,19 +1,52 @@
 from __future__ import annotations
 
 import argparse
+import dataclasses
 import os
+import select
+import signal
+import subprocess
 import sys
-from typing import Iterable
+import time
+from functools import lru_cache
+from typing import Iterable, NoReturn
 
-from stem.core import agent as agent_notes
-from stem.core import db as db_mod
+from stem import core
 from stem.core import git as git_mod
 from stem.core import paths
 from stem.core import queue as queue_mod
-from stem.core import registry
-from stem.core.util import join_tokens, short_text, slugify
-
-
+from stem.core.util import (
+    join_tokens,
+    read_json,
+    short_text,
+    slugify,
+    write_json,
+)
+
+
+_GITIGNORE_MARKER = b".stem/"
+_GITIGNORE_ENTRY = _GITIGNORE_MARKER + b"\n"
+_STEM_REF_PREFIX = "stem/"
+_VERSION = "stem 0.1.0"
+_LIST_LIMIT = 10
+_WATCH_STOP_TIMEOUT = 5.0
+_LIST_LEAVES = 3
+_ANCESTRY_LEAVES = 3
+_BRANCH_LINE = "%s  %s"
+_LEAF_LINE = "  %s  %s"
+
+_ERR_NO_CURRENT_BRANCH = "no current branch set (use `stem jump <branch_id>`)"
+_ERR_FINAL_PROMPT = "final leaf prompt required (use leaf.json or --final)"
+_ERR_AMBIGUOUS_LEAF = "leaf id is ambiguous; use a branch id"
+_ERR_INVALID_COMMAND_FILE = "invalid command file: {}".format
+_ERR_UNSUPPORTED_COMMAND = "unsupported command: {}".format
+_ERR_UNKNOWN_BRANCH = "unknown branch: {}".format
+_ERR_WATCH_STOP_TIMEOUT = "watch did not exit within {:g}s (pid {})".format
+
+_verified_dbs: dict[str, tuple[tuple[int, int], core.db.StemDB]] = {}
+
+
+@lru_cache(maxsize=None)
 def _load_template(name: str) -> str:
     base = os.path.join(os.path.dirname(__file__), "templates")
     path = os.path.join(base, name)
@@ -21,26 +54,52 @@ def _load_template(name: str) -> str:
         return f.read().rstrip()
 
 
+@lru_cache(maxsize=None)
+def _template_bytes(name: str) -> bytes:
+    return (_load_template(name) + "\n").encode("utf-8")
+
+
+def _warn(msg: str) -> None:
+    # Only the stash fallback in jump warns; keep logging off the startup path.
+    import logging
+
+    logging.getLogger("stem").warning(msg)
+
+
 def _repo_root_or_cwd() -> str:
     cwd = os.getcwd()
     root = paths.git_root(cwd)
     return root if root else cwd
 
 
-def _require_stem(repo_root: str) -> db_mod.StemDB:
-    db = db_mod.StemDB(repo_root)
-    if not os.path.exists(db.db_path):
+def _require_stem(repo_root: str) -> core.db.StemDB:
+    # exec and watch run several commands per process; verify each db file
+    # once. Keyed on the file's identity so a watcher notices `.stem` being
+    # removed or recreated instead of writing to the old, unlinked db.
+    try:
+        st = os.stat(paths.stem_db_path(repo_root))
+    except FileNotFoundError:
+        st = None
+    cached = _verified_dbs.get(repo_root)
+    if cached is not None:
+        if st is not None and cached[0] == (st.st_dev, st.st_ino):
+            return cached[1]
+        del _verified_dbs[repo_root]
+        cached[1].close()
+    if st is None:
         _die("stem is not initialized in this repo. Run `stem create` first.")
+    db = core.db.StemDB(repo_root)
     try:
         db.verify_schema()
     except RuntimeError as exc:
         _die(str(exc))
+    _verified_dbs[repo_root] = ((st.st_dev, st.st_ino), db)
     return db
 
 
-def _die(msg: str) -> None:
+def _die(msg: str) -> NoReturn:
     print(msg)
-    sys.exit(1)
+    raise SystemExit(1)
 
 
 def _normalize_prompt(tokens: Iterable[str]) -> str:
@@ -50,21 +109,25 @@ def _normalize_prompt(tokens: Iterable[str]) -> str:
     return raw
 
 
-def _branch_id_from_git_branch(git_branch: str) -> str | None:
-    if not git_branch.startswith("stem/"):
-        return None
-    # stem/<user>/<branch_id>-<slug>
-    parts = git_branch.split("/")
-    if len(parts) < 3:
-        return None
-    tail = parts[2]
-    if "-" not in tail:
-        return None
-    return tail.split("-")[0]
+def _git_branch_name(user: str, branch_id: str, slug: str) -> str:
+    return f"{_STEM_REF_PREFIX}{user}/{branch_id}-{slug}"
 
 
-def _print_kv(title: str, value: str) -> None:
-    print(f"{title}: {value}")
+def _emit_lines(lines: Iterable[str]) -> None:
+    text = "\n".join(lines) + "\n"
+    out = sys.stdout
+    if out is not sys.__stdout__ or out.isatty():
+        out.write(text)
+        return
+    # Bulk listings go straight to fd 1; flush first to keep ordering.
+    out.flush()
+    data = memoryview(text.encode(out.encoding or "utf-8"))
+    while data:
+        data = data[os.write(1, data):]
+
+
+def _print_kv(*pairs: tuple[str, object]) -> None:
+    print("\n".join(f"{title}: {value}" for title, value in pairs))
 
 
 def cmd_create(args: argparse.Namespace) -> None:
@@ -72,26 +135,23 @@ def cmd_create(args: argparse.Namespace) -> None:
     git_mod.ensure_git(repo_root)
     _ensure_gitignore(repo_root)
 
-    db = db_mod.StemDB(repo_root)
+    db = core.db.StemDB(repo_root)
     db.init()
 
-    os.makedirs(paths.stem_agent_dir(repo_root), exist_ok=True)
     os.makedirs(queue_mod.queue_dir(repo_root), exist_ok=True)
     _ensure_agent_templates(repo_root)
-    registry.register_repo(repo_root)
+    core.registry.register_repo(repo_root)
 
     if args.agent:
-        stem_md_path = paths.stem_md_path(repo_root)
-        if not os.path.exists(stem_md_path):
-            template = _load_template("stem.md")
-            with open(stem_md_path, "w", encoding="utf-8") as f:
-                f.write(template + "\n")
-        _ensure_agent_templates(repo_root)
+        try:
+            with open(paths.stem_md_path(repo_root), "xb") as f:
+                f.write(_template_bytes("stem.md"))
+        except FileExistsError:
+            pass
         print(_load_template("bootstrap_prompt.txt"))
         return
 
-    _print_kv("stem", "initialized")
-    _print_kv("repo", repo_root)
+    _print_kv(("stem", "initialized"), ("repo", repo_root))
 
 
 def _run_branch(repo_root: str, prompt: str, summary: str) -> None:
@@ -100,28 +160,26 @@ def _run_branch(repo_root: str, prompt: str, summary: str) -> None:
     safe_user = git_mod.safe_user(repo_root)
     branch_id = db.next_branch_id()
     slug = slugify(prompt)
-    git_branch = f"stem/{safe_user}/{branch_id}-{slug}"
+    git_branch = _git_branch_name(safe_user, branch_id, slug)
 
     git_mod.create_branch(repo_root, git_branch)
     git_mod.add_all(repo_root)
 
-    leaf_id = db.next_leaf_id(branch_id)
+    leaf_id = core.db.FIRST_LEAF_ID
     commit = git_mod.commit(repo_root, f"stem leaf {leaf_id}: {prompt}")
 
     db.insert_branch(branch_id, slug, user, prompt, summary, git_branch)
     db.insert_leaf(branch_id, leaf_id, prompt, summary, commit)
     db.set_current_branch(branch_id)
-    db.set_branch_count(db.get_branch_count() + 1)
+    db.increment_branch_count()
 
-    _print_kv("branch", branch_id)
-    _print_kv("leaf", leaf_id)
-    _print_kv("git", git_branch)
+    _print_kv(("branch", branch_id), ("leaf", leaf_id), ("git", git_branch))
 
 
 def cmd_branch(args: argparse.Namespace) -> None:
     repo_root = _repo_root_or_cwd()
     prompt = _normalize_prompt(args.prompt)
-    note = agent_notes.load_branch_note(repo_root)
+    note = core.agent.load_branch_note(repo_root)
     if not prompt and note:
         prompt = note.prompt
     if not prompt:
@@ -135,7 +193,7 @@ def _run_update(repo_root: str, prompt: str, summary: str) -> None:
     db = _require_stem(repo_root)
     branch_id = db.get_current_branch()
     if not branch_id:
-        _die("no current branch set (use `stem jump <branch_id>`)")
+        _die(_ERR_NO_CURRENT_BRANCH)
     _checkout_branch_id(repo_root, db, branch_id)
 
     leaf_id = db.next_leaf_id(branch_id)
@@ -145,8 +203,7 @@ def _run_update(repo_root: str, prompt: str, summary: str) -> None:
 
     db.insert_leaf(branch_id, leaf_id, prompt, summary, commit)
 
-    _print_kv("leaf", leaf_id)
-    _print_kv("git", commit)
+    _print_kv(("leaf", leaf_id), ("git", commit))
 
 
 def cmd_update(args: argparse.Namespace) -> None:
@@ -166,16 +223,13 @@ def cmd_update(args: argparse.Namespace) -> None:
     repo_root = _repo_root_or_cwd()
 
     prompt = _normalize_prompt(args.prompt)
-    note = agent_notes.load_leaf_note(repo_root)
+    note = core.agent.load_leaf_note(repo_root)
     if not prompt and note:
         prompt = note.prompt
     if not prompt:
         _die("update prompt required")
 
     summary = note.summary if note else prompt
-    prompt = short_text(prompt)
-    summary = short_text(summary)
-
     _run_update(repo_root, short_text(prompt), short_text(summary))
 
 
@@ -186,27 +240,27 @@ def _run_update_branch(
     new_prompt: str,
     new_summary: str,
 ) -> None:
-    repo_root = _repo_root_or_cwd()
+    # Validate before touching git so bad input leaves the tree untouched.
+    if not final_prompt:
+        _die(_ERR_FINAL_PROMPT)
+    if not new_prompt:
+        _die("new branch prompt required")
     db = _require_stem(repo_root)
 
     branch_id = db.get_current_branch()
     if not branch_id:
-        _die("no current branch set (use `stem jump <branch_id>`)")
+        _die(_ERR_NO_CURRENT_BRANCH)
     _checkout_branch_id(repo_root, db, branch_id)
 
     # Final leaf for current branch
-    if not final_prompt:
-        _die("final leaf prompt required (use leaf.json or --final)")
-
+    final_prompt = short_text(final_prompt)
     final_leaf_id = db.next_leaf_id(branch_id)
     git_mod.add_all(repo_root)
-    final_commit = git_mod.commit(
-        repo_root, f"stem leaf {final_leaf_id}: {short_text(final_prompt)}"
-    )
+    final_commit = git_mod.commit(repo_root, f"stem leaf {final_leaf_id}: {final_prompt}")
     db.insert_leaf(
         branch_id,
         final_leaf_id,
-        short_text(final_prompt),
+        final_prompt,
         short_text(final_summary),
         final_commit,
     )
@@ -215,11 +269,11 @@ def _run_update_branch(
     user = git_mod.get_user(repo_root)
     new_branch_id = db.next_branch_id()
     slug = slugify(new_prompt)
-    new_git_branch = f"stem/{user}/{new_branch_id}-{slug}"
+    new_git_branch = _git_branch_name(user, new_branch_id, slug)
 
     git_mod.create_branch(repo_root, new_git_branch)
     git_mod.add_all(repo_root)
-    new_leaf_id = db.next_leaf_id(new_branch_id)
+    new_leaf_id = core.db.FIRST_LEAF_ID
     new_commit = git_mod.commit(repo_root, f"stem leaf {new_leaf_id}: {new_prompt}")
 
     db.insert_branch(
@@ -227,19 +281,21 @@ def _run_update_branch(
     )
     db.insert_leaf(new_branch_id, new_leaf_id, new_prompt, new_summary, new_commit)
     db.set_current_branch(new_branch_id)
-    db.set_branch_count(db.get_branch_count() + 1)
+    db.increment_branch_count()
 
-    _print_kv("final leaf", final_leaf_id)
-    _print_kv("new branch", new_branch_id)
-    _print_kv("new leaf", new_leaf_id)
+    _print_kv(
+        ("final leaf", final_leaf_id),
+        ("new branch", new_branch_id),
+        ("new leaf", new_leaf_id),
+    )
 
 
 def cmd_update_branch(args: argparse.Namespace) -> None:
     repo_root = _repo_root_or_cwd()
-    note = agent_notes.load_leaf_note(repo_root)
+    note = core.agent.load_leaf_note(repo_root)
     final_prompt = args.final or (note.prompt if note else "")
     if not final_prompt:
-        _die("final leaf prompt required (use leaf.json or --final)")
+        _die(_ERR_FINAL_PROMPT)
     final_summary = note.summary if note else final_prompt
 
     new_prompt = _normalize_prompt(args.prompt)
@@ -260,27 +316,31 @@ def _run_jump(repo_root: str, target: str, mode: str | None) -> None:
     db = _require_stem(repo_root)
     branch_id = None
     leaf = None
+    recent = None
 
     if mode == "head":
         branch_id = target
         leaf = db.first_leaf_for_branch(branch_id)
     elif mode == "leaf":
-        matches = db.find_leaves_by_id(target)
+        matches = db.find_leaves_by_id(target) if queue_mod.LEAF_ID_RE.match(target) else []
         if len(matches) == 1:
             leaf = matches[0]
             branch_id = leaf["branch_id"]
         elif len(matches) > 1:
-            _die("leaf id is ambiguous; use a branch id")
+            _die(_ERR_AMBIGUOUS_LEAF)
     else:
-        matches = db.find_leaves_by_id(target)
+        # Branch ids never collide with leaf ids, so skip the leaf lookup.
+        matches = [] if queue_mod.BRANCH_ID_RE.match(target) else db.find_leaves_by_id(target)
         if len(matches) == 1:
             leaf = matches[0]
             branch_id = leaf["branch_id"]
         elif len(matches) > 1:
-            _die("leaf id is ambiguous; use a branch id")
+            _die(_ERR_AMBIGUOUS_LEAF)
         else:
+            # The newest leaf heads the ancestry rows, so one query serves both.
             branch_id = target
-            leaf = db.latest_leaf_for_branch(branch_id)
+            recent = db.list_leaves(branch_id, limit=_ANCESTRY_LEAVES)
+            leaf = recent[0] if recent else None
 
     if not leaf or not branch_id:
         _die("unknown branch or leaf")
@@ -293,7 +353,9 @@ def _run_jump(repo_root: str, target: str, mode: str | None) -> None:
             _die("unknown branch")
         _safe_checkout(repo_root, branch["git_branch"])
 
-    ancestry = _build_ancestry(db, branch_id)
+    if recent is None:
+        recent = db.list_leaves(branch_id, limit=_ANCESTRY_LEAVES)
+    ancestry = _ancestry_text(recent)
 
     db.insert_jump(
         branch_id,
@@ -320,39 +382,77 @@ def cmd_jump(args: argparse.Namespace) -> None:
     _run_jump(repo_root, args.target, mode)
 
 
+def _exec_branch(repo_root: str, cmd: queue_mod.Command) -> None:
+    _run_branch(repo_root, cmd.prompt or "", cmd.summary or (cmd.prompt or ""))
+
+
+def _exec_update(repo_root: str, cmd: queue_mod.Command) -> None:
+    _run_update(
+        repo_root,
+        cmd.prev_prompt or "",
+        cmd.prev_summary or (cmd.prev_prompt or ""),
+    )
+
+
+def _exec_update_branch(repo_root: str, cmd: queue_mod.Command) -> None:
+    _run_update_branch(
+        repo_root,
+        cmd.prev_prompt or "",
+        cmd.prev_summary or (cmd.prev_prompt or ""),
+        cmd.prompt or "",
+        cmd.summary or (cmd.prompt or ""),
+    )
+
+
+def _exec_jump(repo_root: str, cmd: queue_mod.Command) -> None:
+    _run_jump(repo_root, cmd.target or "", cmd.mode)
+
+
+_EXEC_HANDLERS = {
+    "branch": _exec_branch,
+    "update": _exec_update,
+    "update_branch": _exec_update_branch,
+    "jump": _exec_jump,
+}
+
+
 def cmd_exec(args: argparse.Namespace) -> None:
-    repo_root = _repo_root_or_cwd()
+    _exec_queue(_repo_root_or_cwd())
+
+
+def _exec_queue(repo_root: str, files: list[str] | None = None) -> None:
     db = _require_stem(repo_root)
-    files = queue_mod.list_queue_files(repo_root)
-    files += _agent_command_files(repo_root)
+    if files is None:
+        files = queue_mod.list_queue_files(repo_root) + _agent_command_files(repo_root)
     if not files:
         print("no queued commands")
         return
 
     parsed = []
     seen_nonces: set[str] = set()
-    branch_path = os.path.join(paths.stem_agent_dir(repo_root), "branch.json")
-    leaf_path = os.path.join(paths.stem_agent_dir(repo_root), "leaf.json")
+    branch_path, leaf_path = paths.agent_note_paths(repo_root)
 
-    # Handle agent files with inferred commands
-    branch_ready = _command_file_ready(branch_path) if os.path.exists(branch_path) else False
-    leaf_ready = _command_file_ready(leaf_path) if os.path.exists(leaf_path) else False
+    # Handle agent files with inferred commands; each file is parsed once
+    branch_data = _read_command_file(branch_path)
+    leaf_data = _read_command_file(leaf_path)
+    branch_ready = _command_data_ready(branch_path, branch_data)
+    leaf_ready = _command_data_ready(leaf_path, leaf_data)
 
     if branch_ready and leaf_ready:
         # If branch.json was edited after leaf.json, treat as update_branch
         if os.path.getmtime(branch_path) >= os.path.getmtime(leaf_path):
-            cmd = _parse_update_branch(repo_root, branch_path, leaf_path)
+            cmd = _parse_update_branch(repo_root, branch_data, leaf_data, leaf_path)
             parsed.append(cmd)
         else:
-            cmd = _parse_update(repo_root, leaf_path)
+            cmd = _parse_update(repo_root, leaf_path, leaf_data)
             parsed.append(cmd)
-            cmd = _parse_branch(repo_root, branch_path)
+            cmd = _parse_branch(repo_root, branch_path, branch_data)
             parsed.append(cmd)
     else:
         if branch_ready:
-            parsed.append(_parse_branch(repo_root, branch_path))
+            parsed.append(_parse_branch(repo_root, branch_path, branch_data))
         if leaf_ready:
-            parsed.append(_parse_update(repo_root, leaf_path))
+            parsed.append(_parse_update(repo_root, leaf_path, leaf_data))
 
     # Add any queued json files
     for path in files:
@@ -360,7 +460,7 @@ def cmd_exec(args: argparse.Namespace) -> None:
             continue
         cmd = queue_mod.parse_command(path)
         if not cmd:
-            _die(f"invalid command file: {path}")
+            _die(_ERR_INVALID_COMMAND_FILE(path))
         parsed.append(cmd)
 
     processed = 0
@@ -371,26 +471,10 @@ def cmd_exec(args: argparse.Namespace) -> None:
             queue_mod.archive_file(repo_root, cmd.source_file, suffix="dup")
             continue
 
-        if cmd.command == "branch":
-            _run_branch(repo_root, cmd.prompt or "", cmd.summary or (cmd.prompt or ""))
-        elif cmd.command == "update":
-            _run_update(
-                repo_root,
-                cmd.prev_prompt or "",
-                cmd.prev_summary or (cmd.prev_prompt or ""),
-            )
-        elif cmd.command == "update_branch":
-            _run_update_branch(
-                repo_root,
-                cmd.prev_prompt or "",
-                cmd.prev_summary or (cmd.prev_prompt or ""),
-                cmd.prompt or "",
-                cmd.summary or (cmd.prompt or ""),
-            )
-        elif cmd.command == "jump":
-            _run_jump(repo_root, cmd.target or "", cmd.mode)
-        else:
-            _die(f"unsupported command: {cmd.command}")
+        handler = _EXEC_HANDLERS.get(cmd.command)
+        if handler is None:
+            _die(_ERR_UNSUPPORTED_COMMAND(cmd.command))
+        handler(repo_root, cmd)
 
         db.insert_exec_nonce(cmd.nonce, cmd.command, cmd.source_file)
         if cmd.source_file.endswith("branch.json") or cmd.source_file.endswith("leaf.json"):
@@ -402,55 +486,79 @@ def cmd_exec(args: argparse.Namespace) -> None:
     print(f"processed {processed} command(s)")
 
 
-def cmd_watch(args: argparse.Namespace) -> None:
-    import json
-    import time
-    import subprocess
-    import traceback
+def _read_watch_pid(pid_path: str) -> int | None:
+    try:
+        with open(pid_path, "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
 
+def _terminate_watcher(pid: int) -> bool:
+    # Open the pidfd before signalling so a recycled pid can't be waited on,
+    # then block until exit instead of racing the watcher's last heartbeat.
+    try:
+        fd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        fd = None
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError:
+        if fd is not None:
+            os.close(fd)
+        return False
+    if fd is not None:
+        try:
+            ready, _, _ = select.select([fd], [], [], _WATCH_STOP_TIMEOUT)
+        finally:
+            os.close(fd)
+        if not ready:
+            # Still alive: keep the pid file so --daemon won't start a second one.
+            _die(_ERR_WATCH_STOP_TIMEOUT(_WATCH_STOP_TIMEOUT, pid))
+    return True
+
+
+def cmd_watch(args: argparse.Namespace) -> None:
     repo_root = _repo_root_or_cwd()
-    heartbeat_path = os.path.join(repo_root, ".stem", "agent", "watch.json")
-    pid_path = os.path.join(repo_root, ".stem", "agent", "watch.pid")
-    log_path = os.path.join(repo_root, ".stem", "agent", "watch.log")
+    heartbeat_path = paths.watch_heartbeat_path(repo_root)
+    pid_path = paths.watch_pid_path(repo_root)
+    log_path = paths.watch_log_path(repo_root)
 
     if args.stop:
         stopped = False
-        pid = None
-        if os.path.exists(pid_path):
-            try:
-                with open(pid_path, "r", encoding="utf-8") as f:
-                    pid = int(f.read().strip())
-            except Exception:
-                pid = None
+        pid = _read_watch_pid(pid_path)
         if pid is None:
             try:
-                import json
-
-                with open(heartbeat_path, "r", encoding="utf-8") as f:
-                    hb = json.load(f)
+                hb = read_json(heartbeat_path)
                 pid = int(hb.get("pid", 0)) or None
             except Exception:
                 pid = None
         if pid is not None:
+            stopped = _terminate_watcher(pid)
+        for path in (pid_path, heartbeat_path):
             try:
-                os.kill(pid, 15)
-                stopped = True
-            except Exception:
+                os.remove(path)
+            except OSError:
                 pass
-        try:
-            if os.path.exists(pid_path):
-                os.remove(pid_path)
-            if os.path.exists(heartbeat_path):
-                os.remove(heartbeat_path)
-        except Exception:
-            pass
         if stopped:
             print(f"watch stopped (pid {pid})")
             return
         _die("watch not running")
 
     if args.daemon:
-        if os.path.exists(pid_path):
+        # A pid file left by a crashed or killed watcher must not block a restart.
+        pid = _read_watch_pid(pid_path)
+        if pid is not None and _pid_alive(pid):
             _die("watch already running (use `stem watch --stop`)")
         cmd = [
             sys.executable,
@@ -467,18 +575,24 @@ def cmd_watch(args: argparse.Namespace) -> None:
         os.makedirs(os.path.dirname(pid_path), exist_ok=True)
         with open(pid_path, "w", encoding="utf-8") as f:
             f.write(str(proc.pid))
-        print(f"watch started (pid {proc.pid})")
-        print(f"heartbeat: {heartbeat_path}")
+        print(f"watch started (pid {proc.pid})\nheartbeat: {heartbeat_path}")
         return
 
     quiet = bool(args.daemon_child)
     last_nonce = "-"
+    # Loop invariants, bound once for the life of the watcher.
+    pid = os.getpid()
+    delay = max(0.2, args.interval)
+    list_queue_files = queue_mod.list_queue_files
+    sleep = time.sleep
     while True:
         try:
-            files = queue_mod.list_queue_files(repo_root) + _agent_command_files(repo_root)
-            queue_len = len(files)
+            files = list_queue_files(repo_root) + _agent_command_files(repo_root)
+            # The agent notes exist from `stem create` on; only run the queue
+            # when something is actually ready.
+            queue_len = _ready_count(files)
             if queue_len:
-                cmd_exec(args)
+                _exec_queue(repo_root, files)
                 db = _require_stem(repo_root)
                 with db.connect() as conn:
                     row = conn.execute(
@@ -491,6 +605,8 @@ def cmd_watch(args: argparse.Namespace) -> None:
             pass
         except Exception:
             try:
+                import traceback
+
                 with open(log_path, "a", encoding="utf-8") as f:
                     f.write(traceback.format_exc() + "\n")
             except Exception:
@@ -500,47 +616,35 @@ def cmd_watch(args: argparse.Namespace) -> None:
             "queue": queue_len,
             "last_nonce": last_nonce,
             "timestamp": time.time(),
-            "pid": os.getpid(),
+            "pid": pid,
             "interval": args.interval,
         }
         try:
-            os.makedirs(os.path.dirname(heartbeat_path), exist_ok=True)
-            with open(heartbeat_path, "w", encoding="utf-8") as f:
-                json.dump(payload, f)
-        except Exception:
+            write_json(heartbeat_path, payload)
+        except OSError:
             pass
         if not quiet:
             line = f"heartbeat ok | queue {queue_len} | last {last_nonce}"
             print(line.ljust(80), end="\r", flush=True)
-        time.sleep(max(0.2, args.interval))
+        sleep(delay)
 
 
 def cmd_status(args: argparse.Namespace) -> None:
     repo_root = _repo_root_or_cwd()
     db = _require_stem(repo_root)
     queue_files = queue_mod.list_queue_files(repo_root) + _agent_command_files(repo_root)
-    queue_len = 0
-    for path in queue_files:
-        if path.endswith("branch.json") or path.endswith("leaf.json"):
-            if _command_file_ready(path):
-                queue_len += 1
-        else:
-            queue_len += 1
-    heartbeat_path = os.path.join(repo_root, ".stem", "agent", "watch.json")
+    queue_len = _ready_count(queue_files)
+    heartbeat_path = paths.watch_heartbeat_path(repo_root)
     watch_state = "stopped"
-    if os.path.exists(heartbeat_path):
-        try:
-            import json
-            import time
-
-            with open(heartbeat_path, "r", encoding="utf-8") as f:
-                hb = json.load(f)
+    try:
+        hb = read_json(heartbeat_path)
+        if hb is not None:
             age = time.time() - float(hb.get("timestamp", 0))
             interval = float(hb.get("interval", 1.0))
             threshold = max(5.0, interval * 3)
             watch_state = "running" if age <= threshold else "stale"
-        except Exception:
-            watch_state = "unknown"
+    except Exception:
+        watch_state = "unknown"
     with db.connect() as conn:
         row = conn.execute(
             "SELECT nonce, command, created_at FROM command_exec WHERE repo_root = ? ORDER BY id DESC LIMIT 1",
@@ -549,16 +653,16 @@ def cmd_status(args: argparse.Namespace) -> None:
     last = row["nonce"] if row else "-"
     last_cmd = row["command"] if row else "-"
     last_time = row["created_at"] if row else "-"
-    print(f"queue: {queue_len}")
-    print(f"watch: {watch_state}")
-    print(f"last nonce: {last}")
-    print(f"last command: {last_cmd}")
-    print(f"last time: {last_time}")
+    _print_kv(
+        ("queue", queue_len),
+        ("watch", watch_state),
+        ("last nonce", last),
+        ("last command", last_cmd),
+        ("last time", last_time),
+    )
 
 
 def _write_jump_json(repo_root: str, branch_id: str, leaf, ancestry: str) -> None:
-    from stem.core.util import write_json
-
     data = {
         "branch_id": branch_id,
         "leaf_id": leaf["leaf_id"],
@@ -570,13 +674,16 @@ def _write_jump_json(repo_root: str, branch_id: str, leaf, ancestry: str) -> Non
     write_json(path, data)
 
 
-def _build_ancestry(db: db_mod.StemDB, branch_id: str) -> str:
-    leaves = db.list_leaves(branch_id, limit=3)
+def _ancestry_text(leaves: list) -> str:
     parts = [f"{l['leaf_id']}: {short_text(l['prompt'], 60)}" for l in leaves]
     return " | ".join(reversed(parts))
 
 
-def _jump_to_leaf_row(repo_root: str, db: db_mod.StemDB, leaf) -> None:
+def _build_ancestry(db: core.db.StemDB, branch_id: str) -> str:
+    return _ancestry_text(db.list_leaves(branch_id, limit=_ANCESTRY_LEAVES))
+
+
+def _jump_to_leaf_row(repo_root: str, db: core.db.StemDB, leaf) -> None:
     _safe_checkout(repo_root, leaf["git_commit"])
     ancestry = _build_ancestry(db, leaf["branch_id"])
     db.insert_jump(
@@ -594,185 +701,204 @@ def cmd_list(args: argparse.Namespace) -> None:
     repo_root = _repo_root_or_cwd()
     db = _require_stem(repo_root)
 
-    branches = db.list_branches(limit=args.limit)
+    branches = db.list_branch_leaves(limit=args.limit, leaves=args.leaves)
     if not branches:
         print("no branches")
         return
 
-    for b in branches:
-        print(f"{b['branch_id']}  {short_text(b['prompt'], 60)}")
-        leaves = db.list_leaves(b["branch_id"], limit=args.leaves)
-        for l in leaves:
-            print(f"  {l['leaf_id']}  {short_text(l['summary'], 70)}")
+    lines = []
+    for branch_id, prompt, leaves in branches:
+        lines.append(_BRANCH_LINE % (branch_id, short_text(prompt, 60)))
+        for leaf_id, summary in leaves:
+            lines.append(_LEAF_LINE % (leaf_id, short_text(summary, 70)))
+    _emit_lines(lines)
 
 
 def cmd_global(args: argparse.Namespace) -> None:
     if args.repo:
-        repo_root = args.repo
-        row = registry.get_repo(repo_root)
+        repo_root = os.path.abspath(args.repo)
+        row = core.registry.get_repo(repo_root)
         if not row:
             _die("repo not found in registry")
-        db = db_mod.StemDB(repo_root)
+        db = core.db.StemDB(repo_root)
         if not os.path.exists(db.db_path):
             _die("repo has no stem metadata")
-        branches = db.list_branches(limit=10)
-        print(repo_root)
-        for b in branches:
-            print(f"{b['branch_id']}  {short_text(b['prompt'], 60)}")
+        lines = [repo_root]
+        for branch_id, prompt in db.list_branch_prompts(limit=10):
+            lines.append(_BRANCH_LINE % (branch_id, short_text(prompt, 60)))
+        _emit_lines(lines)
         return
 
-    rows = registry.list_repos(limit=args.limit)
+    rows = core.registry.list_repos(limit=args.limit)
     if not rows:
         print("no stem repos")
         return
-    for r in rows:
-        print(r["repo_root"])
+    _emit_lines(r["repo_root"] for r in rows)
 
 
 def cmd_tui(args: argparse.Namespace) -> None:
     print("tui not implemented yet")
 
 
-def build_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser(prog="stem")
-    parser.add_argument(
-        "--version", action="version", version="stem 0.1.0"
-    )
-    sub = parser.add_subparsers(dest="cmd")
+def _add_create(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--agent", action="store_true")
+    p.set_defaults(func=cmd_create)
 
-    create = sub.add_parser("create")
-    create.add_argument("--agent", action="store_true")
-    create.set_defaults(func=cmd_create)
 
-    branch = sub.add_parser("branch")
-    branch.add_argument("prompt", nargs=argparse.REMAINDER)
-    branch.set_defaults(func=cmd_branch)
+def _add_branch(p: argparse.ArgumentParser) -> None:
+    p.add_argument("prompt", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_branch)
 
-    update = sub.add_parser("update")
-    update.add_argument("--final", default="")
-    update.add_argument("prompt", nargs=argparse.REMAINDER)
-    update.set_defaults(func=cmd_update)
 
-    jump = sub.add_parser("jump")
-    jump.add_argument("target")
-    jump.add_argument("leaf_id", nargs="?")
-    jump.add_argument("--head", action="store_true")
-    jump.add_argument("--leaf", action="store_true")
-    jump.set_defaults(func=cmd_jump)
+def _add_update(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--final", default="")
+    p.add_argument("prompt", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_update)
 
-    exec_cmd = sub.add_parser("exec")
-    exec_cmd.set_defaults(func=cmd_exec)
 
-    watch_cmd = sub.add_parser("watch")
-    watch_cmd.add_argument("--interval", type=float, default=1.0)
-    watch_cmd.add_argument("--daemon", action="store_true")
-    watch_cmd.add_argument("--stop", action="store_true")
-    watch_cmd.add_argument("--daemon-child", action="store_true", help=argparse.SUPPRESS)
-    watch_cmd.set_defaults(func=cmd_watch)
+def _add_jump(p: argparse.ArgumentParser) -> None:
+    p.add_argument("target")
+    p.add_argument("leaf_id", nargs="?")
+    p.add_argument("--head", action="store_true")
+    p.add_argument("--leaf", action="store_true")
+    p.set_defaults(func=cmd_jump)
 
-    status_cmd = sub.add_parser("status")
-    status_cmd.set_defaults(func=cmd_status)
 
-    list_cmd = sub.add_parser("list")
-    list_cmd.add_argument("--limit", type=int, default=10)
-    list_cmd.add_argument("--leaves", type=int, default=3)
-    list_cmd.set_defaults(func=cmd_list)
+def _add_exec(p: argparse.ArgumentParser) -> None:
+    p.set_defaults(func=cmd_exec)
 
-    global_cmd = sub.add_parser("global")
-    global_cmd.add_argument("repo", nargs="?")
-    global_cmd.add_argument("--limit", type=int, default=50)
-    global_cmd.set_defaults(func=cmd_global)
 
-    tui = sub.add_parser("tui")
-    tui.set_defaults(func=cmd_tui)
+def _add_watch(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--interval", type=float, default=1.0)
+    p.add_argument("--daemon", action="store_true")
+    p.add_argument("--stop", action="store_true")
+    p.add_argument("--daemon-child", action="store_true", help=argparse.SUPPRESS)
+    p.set_defaults(func=cmd_watch)
 
+
+def _add_status(p: argparse.ArgumentParser) -> None:
+    p.set_defaults(func=cmd_status)
+
+
+def _add_list(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--limit", type=int, default=_LIST_LIMIT)
+    p.add_argument("--leaves", type=int, default=_LIST_LEAVES)
+    p.set_defaults(func=cmd_list)
+
+
+def _add_global(p: argparse.ArgumentParser) -> None:
+    p.add_argument("repo", nargs="?")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=cmd_global)
+
+
+def _add_tui(p: argparse.ArgumentParser) -> None:
+    p.set_defaults(func=cmd_tui)
+
+
+_SUBCOMMANDS = {
+    "create": _add_create,
+    "branch": _add_branch,
+    "update": _add_update,
+    "jump": _add_jump,
+    "exec": _add_exec,
+    "watch": _add_watch,
+    "status": _add_status,
+    "list": _add_list,
+    "global": _add_global,
+    "tui": _add_tui,
+}
+
+
+def build_parser(only: str | None = None) -> argparse.ArgumentParser:
+    # With `only`, just that subcommand's parser is built (enough for its
+    # own --help and errors); top-level help and typos need the full tree.
+    parser = argparse.ArgumentParser(prog="stem")
+    parser.add_argument(
+        "--version", action="version", version=_VERSION
+    )
+    sub = parser.add_subparsers(dest="cmd")
+    for name, add in _SUBCOMMANDS.items():
+        if only is None or name == only:
+            add(sub.add_parser(name))
     return parser
 
 
+def _ready_count(files: list[str]) -> int:
+    return sum(
+        1
+        for path in files
+        if not path.endswith(("branch.json", "leaf.json")) or _command_file_ready(path)
+    )
+
+
 def _agent_command_files(repo_root: str) -> list[str]:
-    base = paths.stem_agent_dir(repo_root)
-    files = []
-    for name in ("branch.json", "leaf.json"):
-        path = os.path.join(base, name)
-        if os.path.exists(path):
-            files.append(path)
-    return files
+    return [p for p in paths.agent_note_paths(repo_root) if os.path.exists(p)]
 
 
 def _assign_nonce(cmd: queue_mod.Command) -> queue_mod.Command:
-    import dataclasses
-    import time
-
     nonce = f"{cmd.command}-{int(time.time())}"
     return dataclasses.replace(cmd, nonce=nonce)
 
 
-def _command_file_ready(path: str) -> bool:
+# The watch loop looks at the agent notes every tick; only reparse a note
+# when its stat signature changes (atomic rewrites also change the inode).
+_command_file_cache: dict[str, tuple[tuple[int, int, int], dict | None]] = {}
+
+
+def _read_command_file(path: str) -> dict | None:
     try:
-        import json
-
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # branch.json: prompt + summary
-        if path.endswith("branch.json"):
-            return bool(data.get("prompt")) and bool(data.get("summary"))
-        # leaf.json: old_prompt + old_summary
-        if path.endswith("leaf.json"):
-            return bool(data.get("prev_prompt") or data.get("old_prompt")) and bool(
-                data.get("prev_summary") or data.get("old_summary")
-            )
+        st = os.stat(path)
+    except OSError:
+        return None
+    sig = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _command_file_cache.get(path)
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+    try:
+        data = read_json(path)
+    except (OSError, ValueError):
+        data = None
+    if type(data) is not dict:
+        data = None
+    _command_file_cache[path] = (sig, data)
+    return data
+
+
+# Each note is ready once every group has at least one non-empty key.
+_READY_FIELDS = {
+    paths.BRANCH_NOTE: (("prompt",), ("summary",)),
+    paths.LEAF_NOTE: (("prev_prompt", "old_prompt"), ("prev_summary", "old_summary")),
+}
+
+
+def _command_data_ready(path: str, data: dict | None) -> bool:
+    if data is None:
         return False
-    except Exception:
+    groups = _READY_FIELDS.get(os.path.basename(path))
+    if groups is None:
         return False
+    return all(any(data.get(key) for key in group) for group in groups)
+
+
+def _command_file_ready(path: str) -> bool:
+    return _command_data_ready(path, _read_command_file(path))
 
 
 def _clear_command_file(path: str) -> None:
     try:
-        import json
-
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = read_json(path)
         for key in ("prompt", "summary", "prev_prompt", "prev_summary", "old_prompt", "old_summary", "nonce"):
             if key in data:
                 data[key] = ""
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, sort_keys=True)
+        write_json(path, data)
     except Exception:
         return
 
 
-def _parse_branch(repo_root: str, path: str) -> queue_mod.Command:
-    cmd = queue_mod.parse_command(path)
-    if cmd and cmd.command:
-        return cmd
-    # infer
-    import json
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def _inferred_command(command: str, data: dict, source_file: str) -> queue_mod.Command:
     return queue_mod.Command(
-        command="branch",
-        prompt=data.get("prompt", ""),
-        summary=data.get("summary", ""),
-        prev_prompt=None,
-        prev_summary=None,
-        branch_id=None,
-        target=None,
-        mode=None,
-        timestamp=None,
-        nonce=data.get("nonce", ""),
-        source_file=path,
-    )
-
-
-def _parse_update(repo_root: str, path: str) -> queue_mod.Command:
-    cmd = queue_mod.parse_command(path)
-    if cmd and cmd.command:
-        return cmd
-    import json
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return queue_mod.Command(
-        command="update",
+        command=command,
         prompt=data.get("prompt", ""),
         summary=data.get("summary", ""),
         prev_prompt=data.get("prev_prompt") or data.get("old_prompt", ""),
@@ -782,89 +908,73 @@ def _parse_update(repo_root: str, path: str) -> queue_mod.Command:
         mode=None,
         timestamp=None,
         nonce=data.get("nonce", ""),
-        source_file=path,
+        source_file=source_file,
     )
 
 
-def _parse_update_branch(repo_root: str, branch_path: str, leaf_path: str) -> queue_mod.Command:
-    import json
-    with open(branch_path, "r", encoding="utf-8") as f:
-        b = json.load(f)
-    with open(leaf_path, "r", encoding="utf-8") as f:
-        l = json.load(f)
-    return queue_mod.Command(
-        command="update_branch",
-        prompt=b.get("prompt", ""),
-        summary=b.get("summary", ""),
-        prev_prompt=l.get("prev_prompt") or l.get("old_prompt", ""),
-        prev_summary=l.get("prev_summary") or l.get("old_summary", ""),
-        branch_id=b.get("branch_id") or l.get("branch_id", ""),
-        target=None,
-        mode=None,
-        timestamp=None,
-        nonce=b.get("nonce") or l.get("nonce", ""),
-        source_file=leaf_path,
-    )
-
+def _parse_branch(repo_root: str, path: str, data: dict) -> queue_mod.Command:
+    cmd = queue_mod.parse_command_data(data, path)
+    if cmd and cmd.command:
+        return cmd
+    return _inferred_command("branch", data, path)
 
-def _ensure_agent_templates(repo_root: str) -> None:
-    base = paths.stem_agent_dir(repo_root)
-    os.makedirs(base, exist_ok=True)
-    for name in ("branch.json", "leaf.json"):
-        dst = os.path.join(base, name)
-        if not os.path.exists(dst):
-            with open(dst, "w", encoding="utf-8") as f:
-                f.write(_load_template(name) + "\n")
 
+def _parse_update(repo_root: str, path: str, data: dict) -> queue_mod.Command:
+    cmd = queue_mod.parse_command_data(data, path)
+    if cmd and cmd.command:
+        return cmd
+    return _inferred_command("update", data, path)
 
-def _set_branch_id(repo_root: str, branch_id: str) -> None:
-    if not branch_id:
-        return
-    for name in ("branch.json", "leaf.json"):
-        path = os.path.join(paths.stem_agent_dir(repo_root), name)
-        if not os.path.exists(path):
-            continue
-        try:
-            import json
 
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            data["branch_id"] = branch_id
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, sort_keys=True)
-        except Exception:
-            continue
+def _parse_update_branch(repo_root: str, b: dict, l: dict, leaf_path: str) -> queue_mod.Command:
+    merged = dict(l)
+    merged["prompt"] = b.get("prompt", "")
+    merged["summary"] = b.get("summary", "")
+    merged["branch_id"] = b.get("branch_id") or l.get("branch_id", "")
+    merged["nonce"] = b.get("nonce") or l.get("nonce", "")
+    return _inferred_command("update_branch", merged, leaf_path)
 
 
-def _last_branch_id(repo_root: str, db: db_mod.StemDB) -> str:
-    row = db.list_branches(limit=1)
-    if not row:
-        return ""
-    return row[0]["branch_id"]
+def _ensure_agent_templates(repo_root: str) -> None:
+    os.makedirs(paths.stem_agent_dir(repo_root), exist_ok=True)
+    for name, dst in zip(paths.AGENT_NOTES, paths.agent_note_paths(repo_root)):
+        # "xb" creates only if missing, so an existing note costs one open.
+        try:
+            with open(dst, "xb") as f:
+                f.write(_template_bytes(name))
+        except FileExistsError:
+            pass
 
 
 def _ensure_gitignore(repo_root: str) -> None:
     path = os.path.join(repo_root, ".gitignore")
-    line = ".stem/\n"
     try:
-        contents = ""
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
+        contents = b""
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            size = 0
+        if size:
+            with open(path, "rb") as f:
                 contents = f.read()
-            if ".stem/" in contents:
+            if _GITIGNORE_MARKER in contents:
                 return
-        with open(path, "a", encoding="utf-8") as f:
-            if contents and not contents.endswith("\n"):
-                f.write("\n")
-            f.write(line)
-    except Exception:
+        entry = _GITIGNORE_ENTRY
+        if contents and not contents.endswith(b"\n"):
+            entry = b"\n" + entry
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, entry)
+        finally:
+            os.close(fd)
+    except OSError:
         return
 
 
-def _checkout_branch_id(repo_root: str, db: db_mod.StemDB, branch_id: str) -> None:
+def _checkout_branch_id(repo_root: str, db: core.db.StemDB, branch_id: str) -> None:
     branch = db.get_branch(branch_id)
     if not branch:
-        _die(f"unknown branch: {branch_id}")
+        _die(_ERR_UNKNOWN_BRANCH(branch_id))
     try:
         _safe_checkout(repo_root, branch["git_branch"])
     except RuntimeError as exc:
@@ -898,17 +1008,66 @@ def _safe_checkout(repo_root: str, ref: str) -> None:
     except RuntimeError as exc:
         _die(str(exc))
     git_mod.checkout_force(repo_root, ref)
-    print("stashed working changes to complete jump")
+    _warn("stashed working changes to complete jump")
 
 
-def main() -> None:
-    parser = build_parser()
-    args = parser.parse_args()
-    if not hasattr(args, "func"):
-        parser.print_help()
+def _fast_args(argv: list[str]) -> argparse.Namespace | None:
+    # Hot invocations with a fixed shape skip building every subparser;
+    # anything else (including --help) goes through build_parser().
+    if argv == ["list"]:
+        return argparse.Namespace(
+            cmd="list", limit=_LIST_LIMIT, leaves=_LIST_LEAVES, func=cmd_list
+        )
+    if len(argv) == 2 and argv[0] == "jump" and not argv[1].startswith("-"):
+        return argparse.Namespace(
+            cmd="jump",
+            target=argv[1],
+            leaf_id=None,
+            head=False,
+            leaf=False,
+            func=cmd_jump,
+        )
+    # `stem watch --daemon` respawns itself with this exact argv.
+    if len(argv) != 4 or argv[0] != "watch" or argv[1] != "--interval" or argv[3] != "--daemon-child":
+        return None
+    try:
+        interval = float(argv[2])
+    except ValueError:
+        return None
+    return argparse.Namespace(
+        cmd="watch",
+        interval=interval,
+        daemon=False,
+        stop=False,
+        daemon_child=True,
+        func=cmd_watch,
+    )
+
+
+def _dispatch(argv: list[str]) -> None:
+    if argv == ["--version"]:
+        print(_VERSION)
         return
+    args = _fast_args(argv)
+    if args is None:
+        parser = build_parser(argv[0] if argv and argv[0] in _SUBCOMMANDS else None)
+        args = parser.parse_args(argv)
+        if not hasattr(args, "func"):
+            parser.print_help()
+            return
     args.func(args)
 
 
+def main() -> None:
+    try:
+        _dispatch(sys.argv[1:])
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader went away (`stem status | head -1`); point stdout at
+        # devnull so the interpreter's final flush doesn't raise again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        raise SystemExit(1)
+
+
 if __name__ == "__main__":
     main()
@@ -1 +1,13 @@
 """Core modules for stem."""
+
+import importlib
+
+_LAZY = {"agent", "db", "git", "paths", "queue", "registry", "util"}
+
+
+def __getattr__(name: str):
+    # `core.agent` etc. import on first use; the import binds the submodule
+    # on this package, so later lookups never come back here.
+    if name in _LAZY:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
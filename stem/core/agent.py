@@ -1,13 +1,12 @@
 from __future__ import annotations
 
-import os
 from dataclasses import dataclass
 
-from .paths import stem_agent_dir
+from .paths import agent_note_paths
 from .util import read_json, short_text
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class AgentNote:
     prompt: str
     summary: str
@@ -19,22 +18,26 @@ def _normalize(text: str) -> str:
 
 def _load_note(path: str) -> AgentNote | None:
     data = read_json(path)
-    if not data:
+    if type(data) is not dict:
         return None
     prompt = data.get("prompt")
-    summary = data.get("summary")
-    if not isinstance(prompt, str) or not isinstance(summary, str):
+    if not isinstance(prompt, str):
         return None
     prompt = _normalize(prompt)
+    if not prompt:
+        return None
+    summary = data.get("summary")
+    if not isinstance(summary, str):
+        return None
     summary = _normalize(summary)
-    if not prompt or not summary:
+    if not summary:
         return None
     return AgentNote(prompt=prompt, summary=summary)
 
 
 def load_branch_note(repo_root: str) -> AgentNote | None:
-    return _load_note(os.path.join(stem_agent_dir(repo_root), "branch.json"))
+    return _load_note(agent_note_paths(repo_root)[0])
 
 
 def load_leaf_note(repo_root: str) -> AgentNote | None:
-    return _load_note(os.path.join(stem_agent_dir(repo_root), "leaf.json"))
+    return _load_note(agent_note_paths(repo_root)[1])
@@ -11,17 +11,45 @@ from .util import now_iso
 SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema.sql")
 
 
+def leaf_id_for(index: int) -> str:
+    major = (index // 26) + 1
+    minor = index % 26
+    return f"{major:03d}{chr(ord('a') + minor)}"
+
+
+FIRST_LEAF_ID = leaf_id_for(0)
+
+
+def _fetch_tuples(conn: sqlite3.Connection, sql: str, params: tuple) -> list[tuple]:
+    # Listings unpack a couple of columns per row; plain tuples skip the
+    # Row object and its by-name lookups.
+    cur = conn.cursor()
+    cur.row_factory = None
+    return cur.execute(sql, params).fetchall()
+
+
 class StemDB:
     def __init__(self, repo_root: str):
         self.repo_root = repo_root
         self.db_path = stem_db_path(repo_root)
         self.schema_version = 1
+        self._conn: sqlite3.Connection | None = None
 
     def connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path, timeout=5.0)
-        conn.row_factory = sqlite3.Row
+        # One connection per StemDB for the life of the process; each
+        # `with self.connect() as conn:` block is still its own transaction.
+        conn = self._conn
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            self._conn = conn
         return conn
 
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
     def init(self) -> None:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
@@ -66,6 +94,13 @@ class StemDB:
     def set_branch_count(self, count: int) -> None:
         self.set_meta("branch_count", str(count))
 
+    def increment_branch_count(self) -> None:
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO meta(key, value) VALUES('branch_count', '1') "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+
     def verify_schema(self) -> None:
         with self.connect() as conn:
             row = conn.execute(
@@ -79,22 +114,17 @@ class StemDB:
                 )
 
     def next_branch_id(self) -> str:
+        # branch_seq holds the next id to hand out. Bumping it first takes the
+        # write lock, so the read below can't race another stem process.
         with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO meta(key, value) VALUES('branch_seq', '2') "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
             row = conn.execute(
                 "SELECT value FROM meta WHERE key = 'branch_seq'"
             ).fetchone()
-            if row is None:
-                seq = 1
-                conn.execute(
-                    "INSERT INTO meta(key, value) VALUES('branch_seq', ?)",
-                    (str(seq + 1),),
-                )
-            else:
-                seq = int(row["value"])
-                conn.execute(
-                    "UPDATE meta SET value = ? WHERE key = 'branch_seq'",
-                    (str(seq + 1),),
-                )
+        seq = int(row["value"]) - 1
         return f"b{seq:04d}"
 
     def next_leaf_id(self, branch_id: str) -> str:
@@ -104,10 +134,7 @@ class StemDB:
                 (self.repo_root, branch_id),
             ).fetchone()
             count = int(row["count"])
-        major = (count // 26) + 1
-        minor = count % 26
-        leaf_id = f"{major:03d}{chr(ord('a') + minor)}"
-        return leaf_id
+        return leaf_id_for(count)
 
     def insert_branch(
         self,
@@ -210,6 +237,56 @@ class StemDB:
                 )
             )
 
+    def list_branch_prompts(self, limit: int = 10) -> list[tuple[str, str]]:
+        with self.connect() as conn:
+            return _fetch_tuples(
+                conn,
+                """
+                SELECT branch_id, prompt FROM branches
+                WHERE repo_root = ?
+                ORDER BY created_at DESC
+                LIMIT ?
+                """,
+                (self.repo_root, limit),
+            )
+
+    def list_branch_leaves(
+        self, limit: int = 10, leaves: int = 3
+    ) -> list[tuple[str, str, list[tuple[str, str]]]]:
+        # One windowed query for the recent leaves of every listed branch,
+        # instead of one leaves query per branch.
+        branches = self.list_branch_prompts(limit)
+        if not branches:
+            return []
+        with self.connect() as conn:
+            rows = _fetch_tuples(
+                conn,
+                """
+                SELECT branch_id, leaf_id, summary FROM (
+                    SELECT branch_id, leaf_id, summary, ROW_NUMBER() OVER (
+                        PARTITION BY branch_id ORDER BY created_at DESC
+                    ) AS rn
+                    FROM leaves
+                    WHERE repo_root = ? AND branch_id IN (
+                        SELECT branch_id FROM branches
+                        WHERE repo_root = ?
+                        ORDER BY created_at DESC
+                        LIMIT ?
+                    )
+                )
+                WHERE ? < 0 OR rn <= ?
+                ORDER BY branch_id, rn
+                """,
+                (self.repo_root, self.repo_root, limit, leaves, leaves),
+            )
+        by_branch: dict[str, list[tuple[str, str]]] = {}
+        for branch_id, leaf_id, summary in rows:
+            by_branch.setdefault(branch_id, []).append((leaf_id, summary))
+        return [
+            (branch_id, prompt, by_branch.get(branch_id, []))
+            for branch_id, prompt in branches
+        ]
+
     def get_branch(self, branch_id: str) -> sqlite3.Row | None:
         with self.connect() as conn:
             return conn.execute(
@@ -242,18 +319,6 @@ class StemDB:
                 )
             )
 
-    def latest_leaf_for_branch(self, branch_id: str) -> sqlite3.Row | None:
-        with self.connect() as conn:
-            return conn.execute(
-                """
-                SELECT * FROM leaves
-                WHERE repo_root = ? AND branch_id = ?
-                ORDER BY created_at DESC
-                LIMIT 1
-                """,
-                (self.repo_root, branch_id),
-            ).fetchone()
-
     def first_leaf_for_branch(self, branch_id: str) -> sqlite3.Row | None:
         with self.connect() as conn:
             return conn.execute(
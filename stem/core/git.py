@@ -1,65 +1,73 @@
 from __future__ import annotations
 
 import os
+from functools import lru_cache
 
-from .util import run, slugify
+from .paths import git_root
+from .util import run_git, slugify
 
 
 def ensure_git(repo_root: str) -> None:
-    res = run(["git", "rev-parse", "--is-inside-work-tree"], cwd=repo_root)
+    # git_root (--show-toplevel) fails inside .git and in bare repos; this
+    # probe succeeds there, so only a directory outside any repo gets init.
+    res = run_git(["rev-parse", "--is-inside-work-tree"], cwd=repo_root)
     if res.code != 0:
-        run(["git", "init"], cwd=repo_root)
+        run_git(["init"], cwd=repo_root)
+        git_root.cache_clear()
 
 
 def current_branch(repo_root: str) -> str:
-    res = run(["git", "rev-parse", "--abbrev-ref", "HEAD"], cwd=repo_root)
+    res = run_git(["rev-parse", "--abbrev-ref", "HEAD"], cwd=repo_root)
     return res.stdout.strip()
 
 
 def status_porcelain(repo_root: str) -> str:
-    res = run(["git", "status", "--porcelain"], cwd=repo_root)
+    # Rename detection is the costly part of status and would also report
+    # "old -> new" pairs that the .stem/ path check cannot parse.
+    res = run_git(["status", "--porcelain", "--no-renames"], cwd=repo_root)
     return res.stdout
 
 
 def create_branch(repo_root: str, branch_name: str) -> None:
-    res = run(["git", "checkout", "-b", branch_name], cwd=repo_root)
+    res = run_git(["checkout", "-b", branch_name], cwd=repo_root)
     if res.code != 0:
         raise RuntimeError(res.stderr or "git checkout -b failed")
 
 
 def checkout(repo_root: str, ref: str) -> None:
-    res = run(["git", "checkout", ref], cwd=repo_root)
+    res = run_git(["checkout", ref], cwd=repo_root)
     if res.code != 0:
         raise RuntimeError(res.stderr or "git checkout failed")
 
 
 def checkout_force(repo_root: str, ref: str) -> None:
-    res = run(["git", "checkout", "-f", ref], cwd=repo_root)
+    res = run_git(["checkout", "-f", ref], cwd=repo_root)
     if res.code != 0:
         raise RuntimeError(res.stderr or "git checkout -f failed")
 
 
 def stash_push(repo_root: str, message: str) -> None:
-    res = run(["git", "stash", "push", "-u", "-m", message], cwd=repo_root)
+    res = run_git(["stash", "push", "-u", "-m", message], cwd=repo_root)
     if res.code != 0:
         raise RuntimeError(res.stderr or "git stash failed")
 
 
 def add_all(repo_root: str) -> None:
-    run(["git", "add", "-A"], cwd=repo_root)
+    run_git(["add", "-A"], cwd=repo_root)
 
 
 def commit(repo_root: str, message: str, allow_empty: bool = True) -> str:
-    args = ["git", "commit", "-m", message]
+    args = ["commit", "-m", message]
     if allow_empty:
         args.append("--allow-empty")
-    run(args, cwd=repo_root)
-    res = run(["git", "rev-parse", "HEAD"], cwd=repo_root)
+    run_git(args, cwd=repo_root)
+    res = run_git(["rev-parse", "HEAD"], cwd=repo_root)
     return res.stdout.strip()
 
 
+@lru_cache(maxsize=None)
 def get_user(repo_root: str) -> str:
-    res = run(["git", "config", "user.name"], cwd=repo_root)
+    res = run_git(["config", "user.name"], cwd=repo_root)
     if res.code == 0 and res.stdout.strip():
         return res.stdout.strip()
     return os.getenv("USER", "user")
@@ -72,5 +80,5 @@ def safe_user(repo_root: str) -> str:
 
 
 def show_stat(repo_root: str, commit: str) -> str:
-    res = run(["git", "show", "--stat", "--oneline", "-1", commit], cwd=repo_root)
+    res = run_git(["show", "--stat", "--oneline", "-1", commit], cwd=repo_root)
     return res.stdout.strip()
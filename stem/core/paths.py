@@ -1,40 +1,71 @@
 from __future__ import annotations
 
 import os
+from functools import lru_cache
 from typing import Optional
 
-from .util import run
+from .util import run_git
 
 
+STEM_DIRNAME = ".stem"
+BRANCH_NOTE = "branch.json"
+LEAF_NOTE = "leaf.json"
+AGENT_NOTES = (BRANCH_NOTE, LEAF_NOTE)
+
+
+@lru_cache(maxsize=None)
 def git_root(cwd: str) -> Optional[str]:
-    res = run(["git", "rev-parse", "--show-toplevel"], cwd=cwd)
+    res = run_git(["rev-parse", "--show-toplevel"], cwd=cwd)
     if res.code != 0:
         return None
     return res.stdout.strip()
 
 
+@lru_cache(maxsize=None)
 def stem_dir(repo_root: str) -> str:
-    return os.path.join(repo_root, ".stem")
+    return os.path.join(repo_root, STEM_DIRNAME)
 
 
+@lru_cache(maxsize=None)
 def stem_db_path(repo_root: str) -> str:
     return os.path.join(stem_dir(repo_root), "stem.db")
 
 
+@lru_cache(maxsize=None)
 def stem_agent_dir(repo_root: str) -> str:
     return os.path.join(stem_dir(repo_root), "agent")
 
 
+@lru_cache(maxsize=None)
+def agent_note_paths(repo_root: str) -> tuple[str, str]:
+    base = stem_agent_dir(repo_root)
+    return os.path.join(base, BRANCH_NOTE), os.path.join(base, LEAF_NOTE)
+
+
+def watch_heartbeat_path(repo_root: str) -> str:
+    return os.path.join(stem_agent_dir(repo_root), "watch.json")
+
+
+def watch_pid_path(repo_root: str) -> str:
+    return os.path.join(stem_agent_dir(repo_root), "watch.pid")
+
+
+def watch_log_path(repo_root: str) -> str:
+    return os.path.join(stem_agent_dir(repo_root), "watch.log")
+
+
 def stem_md_path(repo_root: str) -> str:
     return os.path.join(repo_root, "stem.md")
 
 
+@lru_cache(maxsize=None)
 def registry_dir() -> str:
     override = os.getenv("STEM_HOME")
     if override:
         return os.path.abspath(override)
-    return os.path.join(os.path.expanduser("~"), ".stem")
+    return os.path.join(os.path.expanduser("~"), STEM_DIRNAME)
 
 
+@lru_cache(maxsize=None)
 def registry_db_path() -> str:
     return os.path.join(registry_dir(), "registry.db")
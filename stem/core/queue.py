@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-import json
 import os
 from dataclasses import dataclass
+from operator import itemgetter
 import re
 
-from .util import short_text
+from .paths import stem_agent_dir
+from .util import loads_json, short_text
 
 
 ALLOWED_COMMANDS = {"branch", "update", "update_branch", "jump"}
@@ -26,10 +27,12 @@ ALLOWED_KEYS = {
     "schema_version",
 }
 
-BRANCH_ID_RE = re.compile("^b\\d{4}$")
+# Ids are zero-padded to a minimum width and widen past b9999 / 999z.
+BRANCH_ID_RE = re.compile(r"\Ab[0-9]{4,}\Z")
+LEAF_ID_RE = re.compile(r"\A[0-9]{3,}[a-z]\Z")
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Command:
     command: str
     prompt: str | None
@@ -45,26 +48,29 @@ class Command:
 
 
 def queue_dir(repo_root: str) -> str:
-    return os.path.join(repo_root, ".stem", "agent", "queue")
+    return os.path.join(stem_agent_dir(repo_root), "queue")
 
 
 def archive_dir(repo_root: str) -> str:
-    return os.path.join(repo_root, ".stem", "agent", "archive")
+    return os.path.join(stem_agent_dir(repo_root), "archive")
 
 
 def list_queue_files(repo_root: str) -> list[str]:
-    qdir = queue_dir(repo_root)
-    if not os.path.isdir(qdir):
+    try:
+        entries = os.scandir(queue_dir(repo_root))
+    except (FileNotFoundError, NotADirectoryError):
         return []
-    files = [os.path.join(qdir, f) for f in os.listdir(qdir) if f.endswith(".json")]
-    return sorted(files, key=lambda p: os.path.getmtime(p))
+    with entries:
+        files = [(e.stat().st_mtime, e.path) for e in entries if e.name.endswith(".json")]
+    files.sort(key=itemgetter(0))
+    return [path for _, path in files]
 
 
 def _load_json(path: str) -> dict | None:
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
+        with open(path, "rb") as f:
+            return loads_json(f.read())
+    except (OSError, ValueError):
         return None
 
 
@@ -75,7 +81,10 @@ def _norm(text: str | None) -> str | None:
 
 
 def parse_command(path: str) -> Command | None:
-    data = _load_json(path)
+    return parse_command_data(_load_json(path), path)
+
+
+def parse_command_data(data: dict | None, path: str) -> Command | None:
     if not isinstance(data, dict):
         return None
     if any(key not in ALLOWED_KEYS for key in data.keys()):
@@ -139,8 +148,8 @@ def archive_file(repo_root: str, path: str, suffix: str = "done") -> None:
     dst = os.path.join(archive_dir(repo_root), f"{base}.{suffix}")
     try:
         os.replace(path, dst)
-    except Exception:
+    except OSError:
         try:
             os.remove(path)
-        except Exception:
+        except OSError:
             return
@@ -17,15 +17,15 @@ CREATE TABLE IF NOT EXISTS repos (
 """
 
 
-def init_registry() -> None:
+def _open_registry() -> sqlite3.Connection:
     os.makedirs(registry_dir(), exist_ok=True)
-    with sqlite3.connect(registry_db_path()) as conn:
-        conn.executescript(REGISTRY_SCHEMA)
+    conn = sqlite3.connect(registry_db_path())
+    conn.executescript(REGISTRY_SCHEMA)
+    return conn
 
 
 def register_repo(repo_root: str) -> None:
-    init_registry()
-    with sqlite3.connect(registry_db_path()) as conn:
+    with _open_registry() as conn:
         conn.execute(
             "INSERT OR IGNORE INTO repos(repo_root, created_at) VALUES(?, ?)",
             (repo_root, now_iso()),
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import json
 import os
 import re
 import subprocess
@@ -8,18 +7,24 @@ from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import Iterable
 
+# orjson is optional and costs several ms to import; resolve it (and the json
+# fallback) on the first JSON call so commands that never touch JSON don't pay.
+_UNRESOLVED = object()
+_orjson = _UNRESOLVED
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class CmdResult:
     code: int
     stdout: str
     stderr: str
 
 
-def run(cmd: list[str], cwd: str | None = None) -> CmdResult:
+def run(cmd: list[str], cwd: str | None = None, env: dict[str, str] | None = None) -> CmdResult:
     proc = subprocess.run(
         cmd,
         cwd=cwd,
+        env=env,
         text=True,
         capture_output=True,
         check=False,
@@ -27,6 +32,13 @@ def run(cmd: list[str], cwd: str | None = None) -> CmdResult:
     return CmdResult(proc.returncode, proc.stdout.strip(), proc.stderr.strip())
 
 
+def run_git(args: list[str], cwd: str | None = None) -> CmdResult:
+    # Don't take index.lock for opportunistic refreshes (an editor's own git
+    # status may hold it) and never block on a credential prompt.
+    env = {**os.environ, "GIT_OPTIONAL_LOCKS": "0", "GIT_TERMINAL_PROMPT": "0"}
+    return run(["git", *args], cwd=cwd, env=env)
+
+
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
@@ -38,20 +50,76 @@ def slugify(text: str, max_len: int = 40) -> str:
     return cleaned[:max_len]
 
 
+def _get_orjson():
+    global _orjson
+    if _orjson is _UNRESOLVED:
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        _orjson = orjson
+    return _orjson
+
+
+def loads_json(raw: bytes | str):
+    orjson = _get_orjson()
+    if orjson is not None:
+        return orjson.loads(raw)
+    import json
+
+    return json.loads(raw)
+
+
+def dumps_json(data: dict) -> bytes:
+    orjson = _get_orjson()
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+    import json
+
+    return json.dumps(data, indent=2, sort_keys=True).encode("utf-8")
+
+
 def read_json(path: str) -> dict | None:
-    if not os.path.exists(path):
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
         return None
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return loads_json(raw)
+
+
+def write_bytes(path: str, data: bytes) -> None:
+    # Write beside the target and rename so readers never see a partial file.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        f = open(tmp, "wb")
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(tmp, "wb")
+    try:
+        with f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
 
 
 def write_json(path: str, data: dict) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, sort_keys=True)
+    write_bytes(path, dumps_json(data))
 
 
 def short_text(text: str, max_len: int = 120) -> str:
+    # Collapsing a bounded prefix yields a prefix of the fully collapsed
+    # text, so long inputs only need the full pass when the prefix is short.
+    head = text[: 4 * max_len]
+    if len(head) < len(text):
+        t = " ".join(head.split())
+        if len(t) > max_len:
+            return t[: max_len - 1].rstrip() + "…"
     t = " ".join(text.split())
     if len(t) <= max_len:
         return t